@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
 
+import hashlib
+import itertools
 import logging
+import os
 import queue
+import random
 import threading
-from typing import Dict
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
-# Abstract Networking Library
-# import requests
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from requests_toolbelt.multipart.encoder import MultipartEncoder
+from urllib3.util.retry import Retry
 
-@dataclass
 class BackendClient:
     """
     Handles reliable communication with the cloud-based management dashboard.
@@ -22,77 +32,696 @@ class BackendClient:
         """
         self.server_url = config.backend_url
         self.api_key = config.device_id
+        self.username = config.backend_username
+        self.password = config.backend_password
+        self.access_token = None
+        self.refresh_token = None
+
+        # Constant head of every batch body, serialized once:
+        # {"device_id":"...","detections":  + <batch> + }
+        self._batch_prefix = orjson.dumps({'device_id': self.api_key})[:-1] + b',"detections":'
+        self.token_expires_at = 0.0
+
+        # Token state is shared between the upload worker and the refresher
+        self._token_lock = threading.RLock()
+        self._refresh_requested = threading.Event()
+        self._refresh_margin = 45  # seconds before expiry
+        self._cached_headers = None  # rebuilt only when the token rotates
+
+        # Tokens survive restarts so a reboot does not force a full login
+        self.token_storage_path = Path("tokens.json")
+        self._last_token_digest = None
+
+        # One pooled session for every call: keeps TCP/TLS connections alive
+        self._session = self._create_session()
         
-        # Async Upload Queue
-        self.upload_queue = queue.Queue()
+        # Async Upload Queue (drained in batches of up to `batch_size`).
+        # Producers are the detection loop and the sensor-trigger thread, the
+        # consumer is the upload worker: deque append/popleft are atomic, the
+        # Event only wakes the worker. Oldest items drop when full; the
+        # producer lock only keeps the full-check and drop count consistent.
+        self.upload_queue = deque(maxlen=10000)
+        self._enqueue_lock = threading.Lock()
+        self._queue_event = threading.Event()
+        self._running = False
+        self._stopped = threading.Event()
+        self._worker = None
+
+        # Pause between failed batches: exponential with jitter, reset on success
+        self._backoff = 0.1
+        self._retry_after = None
+        self.batch_size = config.upload_batch_size
+        self.batch_delay = config.upload_interval
         self.offline_storage_path = Path("offline_buffer/")
 
+        # Append-only offline log (JSON Lines); rotated to a new segment on replay.
+        # A replay is started after the first delivered batch that follows a
+        # persisted failure; at most one runs at a time.
+        self._offline_file = None
+        self._offline_lock = threading.Lock()
+        self._offline_pending = True  # segments may be left from a previous run
+        self._replay_lock = threading.Lock()
+        self._device_id_hash = hashlib.blake2s(
+            str(self.api_key).encode(), digest_size=4
+        ).hexdigest()
+        # Records currently buffered on disk, maintained incrementally so
+        # stats never rescan the directory; leftovers from a previous run
+        # are added by _seed_offline in the background
+        self._offline_count = 0
+
+        # Recycled payload dicts, see _prepare_upload_data
+        self._upload_dict_pool = queue.LifoQueue(maxsize=32)
+        for _ in range(self._upload_dict_pool.maxsize):
+            self._upload_dict_pool.put_nowait({'location': {}, 'metadata': {}})
+
+        # Aggregate counters, updated per item rather than per request
+        self.stats = {'uploaded': 0, 'failed': 0, 'batches': 0, 'dropped': 0}
+
+    def _create_session(self) -> requests.Session:
+        """
+        Build a keep-alive session with transport-level retries on 429/5xx.
+        Status retries are limited to GET: a POST may already have been
+        accepted (duplicate batches) and a streamed multipart body cannot be
+        rewound. POSTs only retry failed connects, before any body is sent.
+        """
+        retry = Retry(
+            total=3,
+            backoff_factor=0.5,
+            status_forcelist=[429, 502, 503, 504],
+            allowed_methods=frozenset({'GET'}),
+            raise_on_status=False,
+        )
+        # Single backend host: one pool, kept warm between uploads
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=16, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
     def initialize(self):
         """
         Authenticate with the backend and start the upload worker.
         """
-        if self._authenticate():
-            self._start_worker()
-            self._process_offline_buffer()
+        authenticated = self._load_saved_tokens() or self._authenticate()
+        if authenticated:
+            self._test_connection()
         else:
+            # The refresher keeps retrying the login; until then failed
+            # uploads are persisted and replayed after the first success
             logging.warning("Offline Mode: Backend authentication failed")
 
+        # Snapshot before the worker can open a new segment of its own
+        leftovers = list(self.offline_storage_path.glob("detection_*.jsonl"))
+        self._start_worker()
+        threading.Thread(target=self._token_refresher, daemon=True).start()
+        # Count (and replay) in the background so a large backlog does not hold up startup
+        threading.Thread(
+            target=self._seed_offline, args=(leftovers, authenticated), daemon=True
+        ).start()
+
     def _authenticate(self) -> bool:
         """
         Perform JWT-based authentication handshake.
         """
-        # payload = {user, pass}
-        # response = requests.post(login_url, json=payload)
-        # if success: store_token()
+        payload = {'username': self.username, 'password': self.password}
+        try:
+            response = self._session.post(
+                f"{self.server_url}/api/auth/login", json=payload, timeout=10
+            )
+        except requests.RequestException as e:
+            logging.warning(f"Authentication request failed: {e}")
+            return False
+
+        if response.status_code != 200:
+            return False
+
+        return self._store_token_response(response)
+
+    def _test_connection(self) -> bool:
+        """
+        Authenticated health check. Also leaves a live keep-alive connection
+        in the pool so the first upload skips the handshake.
+        """
+        try:
+            response = self._session.get(
+                f"{self.server_url}/api/health",
+                headers=self._get_auth_headers(),
+                timeout=5,
+            )
+        except requests.RequestException as e:
+            logging.warning(f"Backend health check failed: {e}")
+            return False
+
+        if response.status_code != 200:
+            logging.warning(f"Backend health check returned {response.status_code}")
+            return False
         return True
 
+    def _refresh_access_token(self) -> bool:
+        """
+        Exchange the refresh token for a new access token.
+        Falls back to a full login if the refresh is rejected.
+        """
+        with self._token_lock:
+            payload = {'refreshToken': self.refresh_token}
+        try:
+            response = self._session.post(
+                f"{self.server_url}/api/auth/refresh", json=payload, timeout=10
+            )
+        except requests.RequestException as e:
+            logging.warning(f"Token refresh failed: {e}")
+            return False
+
+        if response.status_code != 200:
+            return self._authenticate()
+
+        return self._store_token_response(response)
+
+    def _store_token_response(self, response: requests.Response) -> bool:
+        """
+        Parses a small auth/refresh JSON body straight from the raw bytes.
+        """
+        try:
+            token_data = orjson.loads(response.content)
+        except orjson.JSONDecodeError:
+            logging.warning("Malformed token response from backend")
+            return False
+        return self._store_tokens(token_data)
+
+    def _store_tokens(self, token_data: Dict) -> bool:
+        """
+        Swap in a new token set from an auth/refresh response.
+        """
+        access_token = token_data.get('accessToken')
+        if access_token is None:
+            return False
+
+        with self._token_lock:
+            self.access_token = access_token
+            self.refresh_token = token_data.get('refreshToken', self.refresh_token)
+            self.token_expires_at = time.time() + token_data.get('expiresIn', 900)
+            self._cached_headers = None
+        self._save_tokens()
+        return True
+
+    def _save_tokens(self):
+        """
+        Persists the token set atomically (temp file + os.replace), skipping
+        the write when it is identical to what is already on disk.
+        """
+        with self._token_lock:
+            body = orjson.dumps({
+                'access_token': self.access_token,
+                'refresh_token': self.refresh_token,
+                'expires_at': self.token_expires_at,
+            })
+        digest = hashlib.blake2s(body).digest()
+        if digest == self._last_token_digest:
+            return
+
+        tmp_path = self.token_storage_path.with_suffix('.json.tmp')
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(body)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.token_storage_path)
+        except OSError as e:
+            logging.warning(f"Could not save tokens: {e}")
+            return
+        self._last_token_digest = digest
+
+    def _load_saved_tokens(self) -> bool:
+        """
+        Restores tokens from a previous run. True if the access token is
+        still valid and login can be skipped.
+        """
+        try:
+            body = self.token_storage_path.read_bytes()
+            token_data = orjson.loads(body)
+        except (OSError, orjson.JSONDecodeError):
+            return False
+
+        with self._token_lock:
+            self.access_token = token_data.get('access_token')
+            self.refresh_token = token_data.get('refresh_token')
+            self.token_expires_at = token_data.get('expires_at', 0.0)
+            self._cached_headers = None
+        self._last_token_digest = hashlib.blake2s(body).digest()
+        return self.access_token is not None and self.token_expires_at > time.time()
+
+    def _token_refresher(self):
+        """
+        Background loop: refreshes the token shortly before it expires, or
+        immediately when an upload reports 401, so the upload worker never
+        blocks on a refresh round-trip.
+        """
+        while self._running:
+            with self._token_lock:
+                delay = self.token_expires_at - self._refresh_margin - time.time()
+            self._refresh_requested.wait(timeout=max(0.0, delay))
+            self._refresh_requested.clear()
+            if not self._running:
+                return
+
+            # The lock is only taken for the swap in _store_tokens, so uploads
+            # keep using the still-valid old token during the round-trip.
+            if not self._refresh_access_token():
+                # Back off before retrying a failed refresh
+                self._refresh_requested.wait(timeout=self._refresh_margin)
+
+    def _get_auth_headers(self) -> Dict[str, str]:
+        """
+        Headers for authenticated API calls; only reads the current token.
+        The dict is shared between calls and must not be mutated.
+        """
+        with self._token_lock:
+            if self._cached_headers is None:
+                self._cached_headers = {
+                    'Authorization': f"Bearer {self.access_token}",
+                    'Content-Type': "application/json",
+                    'X-Device-ID': f"{self.api_key}",
+                }
+            return self._cached_headers
+
     def upload_detection(self, data: Dict):
         """
         Public API: Enqueues a detection event for upload.
         """
-        self.upload_queue.put(data)
+        upload_data = self._prepare_upload_data(data)
+        with self._enqueue_lock:
+            if len(self.upload_queue) == self.upload_queue.maxlen:
+                self.stats['dropped'] += 1
+            self.upload_queue.append(upload_data)
+        self._queue_event.set()
+
+    def upload_image(self, detection_id: str, image_path: str) -> bool:
+        """
+        Public API: Uploads an annotated detection image.
+        The file is streamed from disk rather than read into memory.
+        """
+        path = Path(image_path)
+        try:
+            with open(path, 'rb') as f:
+                encoder = MultipartEncoder(fields={
+                    'detection_id': str(detection_id),
+                    'image': (path.name, f, 'image/jpeg'),
+                })
+                headers = {**self._get_auth_headers(), 'Content-Type': encoder.content_type}
+                response = self._session.post(
+                    f"{self.server_url}/api/detections/{detection_id}/image",
+                    data=encoder,
+                    headers=headers,
+                    timeout=60,
+                )
+        except (OSError, requests.RequestException) as e:
+            logging.warning(f"Image upload failed for {detection_id}: {e}")
+            return False
+
+        return response.status_code // 100 == 2
+
+    def _prepare_upload_data(self, record: Dict) -> Dict:
+        """
+        Maps a detection record onto the API payload. The payload dict (and
+        its nested dicts) come from a small pool and are returned to it by
+        _release_upload_data once the upload worker is done with them.
+        """
+        try:
+            upload_data = self._upload_dict_pool.get_nowait()
+        except queue.Empty:
+            upload_data = {'location': {}, 'metadata': {}}
+
+        location = record.get('location') or {}
+
+        # Detections arrive as parallel arrays (max confidence already taken
+        # during decode); per-detection dicts are only built here, at the JSON boundary
+        detections = record['detections']
+        max_confidence = record.get('confidence') or 0.0
+
+        # UTC with a 'Z' suffix, the same form test_backend.py sends
+        upload_data['timestamp'] = datetime.fromtimestamp(
+            record['timestamp_ns'] / 1e9, timezone.utc
+        ).isoformat().replace('+00:00', 'Z')
+        upload_data['trigger_source'] = record.get('trigger_source')
+        upload_data['confidence'] = record.get('confidence')
+        upload_data['detections'] = detections.to_dicts()
+        upload_data['location']['latitude'] = location.get('latitude')
+        upload_data['location']['longitude'] = location.get('longitude')
+        upload_data['metadata']['detection_count'] = len(detections)
+        upload_data['metadata']['max_confidence'] = max_confidence
+        return upload_data
+
+    def _release_upload_data(self, upload_data: Dict):
+        location = upload_data['location']
+        metadata = upload_data['metadata']
+        upload_data.clear()
+        location.clear()
+        metadata.clear()
+        upload_data['location'] = location
+        upload_data['metadata'] = metadata
+        try:
+            self._upload_dict_pool.put_nowait(upload_data)
+        except queue.Full:
+            pass
 
     def _start_worker(self):
         """
         Starts the background thread that consumes the upload queue.
         """
-        # threading.Thread(target=self._upload_loop).start()
-        ...
+        self._running = True
+        self._worker = threading.Thread(target=self._upload_loop, daemon=True)
+        self._worker.start()
 
     def _upload_loop(self):
         """
         Worker loop:
-        1. Dequeue item
-        2. Attempt HTTP POST
-        3. Handle Retry/Failure (Exponential Backoff)
+        1. Drain a batch of items
+        2. Attempt a single HTTP POST for the whole batch
+        3. Handle Retry/Failure (split once, then persist survivors)
+        Exits once stopped and the queue is empty.
+        """
+        while True:
+            batch = self._drain_batch(self.batch_size, self.batch_delay)
+            if batch:
+                if self._running:
+                    delivered = self._upload_batch(batch)
+                else:
+                    # Shutting down: during an outage the POSTs could outlast
+                    # cleanup()'s join, so persist the rest for the next run
+                    self._persist_batch(batch)
+                    delivered = False
+                # Sent or persisted by now: payloads can be recycled
+                for upload_data in batch:
+                    self._release_upload_data(upload_data)
+                if not delivered:
+                    self._backoff_wait()
+                elif self._offline_pending:
+                    # Backend reachable again: send what was persisted meanwhile
+                    self._start_replay()
+            elif not self._running:
+                return
+
+    def _drain_batch(self, max_size: int, max_delay: float) -> List[Dict]:
+        """
+        Sleeps (no polling) until the first item arrives or the client is
+        stopped, then lingers up to `max_delay` seconds for the batch to
+        fill to `max_size`.
         """
+        while not self.upload_queue and self._running:
+            self._queue_event.wait()
+            self._queue_event.clear()
+
+        deadline = time.monotonic() + max_delay
+        batch = []
         while True:
-            item = self.upload_queue.get()
+            # Cleared before popping: an append from here on re-arms the event
+            self._queue_event.clear()
+            while len(batch) < max_size:
+                try:
+                    batch.append(self.upload_queue.popleft())
+                except IndexError:
+                    break
+
+            remaining = deadline - time.monotonic()
+            if len(batch) >= max_size or remaining <= 0 or not self._running:
+                return batch
+            self._queue_event.wait(timeout=remaining)
+
+    def _upload_batch(self, batch: List[Dict]) -> bool:
+        """
+        Sends a batch; if the server rejects its payload, splits it in half
+        and retries each half once. Anything still failing is persisted for
+        the offline buffer. Returns False if anything had to be persisted.
+        """
+        status = self._send_batch(batch)
+        if status is not None and status // 100 == 2:
+            return True
+        # Unreachable, 5xx, throttled (429) or stale token (401): the halves
+        # would fail the same way, so persist now and let the backoff apply
+        if status is None or status in (401, 429) or status >= 500:
+            self._persist_batch(batch)
+            return False
+
+        delivered = True
+        mid = len(batch) // 2
+        for chunk in (batch[:mid], batch[mid:]):
+            if not chunk or self._try_send(chunk):
+                continue
+            delivered = False
+            self._persist_batch(chunk)
+        return delivered
+
+    def _persist_batch(self, batch: List[Dict]):
+        """
+        Writes undelivered items to the offline segment for a later replay.
+        """
+        self.stats['failed'] += len(batch)
+        for item in batch:
+            self._save_to_disk(item)
+        self._offline_pending = True
+        self._flush_offline()
+
+    def _backoff_wait(self):
+        """
+        Sleeps after a failed batch so an outage is not hammered. Honours a
+        server Retry-After; wakes early on cleanup().
+        """
+        if self._retry_after is not None:
+            delay = self._retry_after
+            self._retry_after = None
+        else:
+            delay = min(30.0, self._backoff) * (0.5 + random.random())
+            self._backoff *= 2
+        self._stopped.wait(timeout=delay)
+
+    def _try_send(self, batch: List[Dict]) -> bool:
+        status = self._send_batch(batch)
+        return status is not None and status // 100 == 2
+
+    def _send_batch(self, batch: List[Dict]) -> Optional[int]:
+        """
+        Sends a batch and returns the HTTP status, or None if the request
+        did not get a response.
+        """
+        try:
+            status = self._send_http_request(batch)
+        except Exception as e:
+            logging.warning(f"Batch upload error: {e}")
+            return None
+
+        if status // 100 == 2:
+            self.stats['uploaded'] += len(batch)
+            self.stats['batches'] += 1
+            self._backoff = 0.1
+        return status
+
+    def _send_http_request(self, batch: List[Dict]) -> int:
+        """
+        Executes the actual REST API call for a batch of detections.
+        """
+        response = self._session.post(
+            f"{self.server_url}/api/detections/batch",
+            data=self._batch_prefix + orjson.dumps(batch) + b'}',
+            headers=self._get_auth_headers(),
+            timeout=30,
+        )
+        if response.status_code == 401:
+            # Let the refresher renew the token; this batch goes the failure path
+            self._refresh_requested.set()
+        elif response.status_code == 429:
+            # Throttled; honour the server's pause before the next batch
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                self._retry_after = min(300.0, float(retry_after))
+        return response.status_code
+
+    def _save_to_disk(self, data: Dict):
+        """
+        Appends a failed upload to the active offline segment.
+        Writes are buffered; _flush_offline() pushes them out once per batch.
+        """
+        with self._offline_lock:
+            if self._offline_file is None:
+                self.offline_storage_path.mkdir(exist_ok=True)
+                filename = f"detection_{self._device_id_hash}_{time.time_ns()}.jsonl"
+                self._offline_file = open(self.offline_storage_path / filename, 'ab')
+            self._offline_file.write(orjson.dumps(data) + b'\n')
+            self._offline_count += 1
+
+    def _flush_offline(self):
+        with self._offline_lock:
+            if self._offline_file is not None:
+                self._offline_file.flush()
+
+    def _rotate_offline(self):
+        """
+        Closes the active segment so it can be replayed; the next failure
+        starts a new one.
+        """
+        with self._offline_lock:
+            if self._offline_file is not None:
+                self._offline_file.close()
+                self._offline_file = None
+
+    def _seed_offline(self, segments: List[Path], replay: bool):
+        """
+        Adds records left on disk by a previous run to the offline count,
+        then replays them if the backend is reachable. Holds the replay
+        lock throughout so a replay cannot discount uncounted segments.
+        """
+        self._replay_lock.acquire()
+        count = 0
+        for path in segments:
             try:
-                success = self._send_http_request(item)
-                if not success:
-                    self._save_to_disk(item)
-            except Exception:
-                self._save_to_disk(item)
+                count += path.read_bytes().count(b'\n')
+            except OSError as e:
+                logging.warning(f"Cannot read offline segment {path.name}: {e}")
+        with self._offline_lock:
+            self._offline_count += count
 
-    def _send_http_request(self, data: Dict) -> bool:
+        if replay:
+            self._offline_pending = False
+            self._replay_offline()  # releases the replay lock
+        else:
+            self._replay_lock.release()
+
+    def _start_replay(self):
         """
-        Executes the actual REST API call.
+        Starts a background offline replay unless one is already running
+        (the pending flag then stays set for the next delivered batch).
         """
-        # headers = {Authorization: Bearer <token>}
-        # requests.post(url, json=data, headers=headers)
+        if not self._replay_lock.acquire(blocking=False):
+            return
+        self._offline_pending = False
+        threading.Thread(target=self._replay_offline, daemon=True).start()
+
+    def _replay_offline(self):
+        try:
+            if not self._process_offline_buffer():
+                self._offline_pending = True
+        finally:
+            self._replay_lock.release()
+
+    def _process_offline_buffer(self, max_batch: int = 500) -> bool:
+        """
+        Replays detections persisted while the backend was unreachable,
+        oldest segment first, in batches of up to `max_batch` per POST.
+        Segments are read and parsed on a small pool while earlier ones
+        are being sent. Returns False if replay stopped on a failed send.
+        """
+        self._rotate_offline()
+        segments = sorted(
+            self.offline_storage_path.glob("detection_*.jsonl"),
+            key=lambda p: p.stat().st_mtime,
+        )
+        with self._offline_lock:
+            if self._offline_file is not None:
+                # Opened by the worker after rotation; still being appended to
+                active = Path(self._offline_file.name)
+                segments = [path for path in segments if path != active]
+
+        # Read ahead at most one segment per worker, so a long backlog is
+        # never parsed into memory all at once
+        read_ahead = 4
+        paths = iter(segments)
+        with ThreadPoolExecutor(max_workers=read_ahead) as pool:
+            in_flight = deque(
+                (path, pool.submit(self._read_segment, path))
+                for path in itertools.islice(paths, read_ahead)
+            )
+            while in_flight:
+                path, future = in_flight.popleft()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    in_flight.append((next_path, pool.submit(self._read_segment, next_path)))
+
+                segment = future.result()
+                if segment is None:
+                    continue
+                if not self._replay_segment(path, *segment, max_batch):
+                    logging.warning("Offline replay failed; keeping buffered detections")
+                    pool.shutdown(cancel_futures=True)
+                    return False
         return True
 
-    def _save_to_disk(self, data: Dict):
+    def _read_segment(self, path: Path) -> Optional[Tuple[int, List[Dict]]]:
         """
-        Persists failed uploads to local storage for later retry.
+        Returns (line count, parsed records) for one segment, or None if
+        it cannot be read.
         """
-        # json.dump(data, file)
-        ...
+        try:
+            lines = path.read_bytes().splitlines()
+        except OSError as e:
+            logging.warning(f"Cannot read offline segment {path.name}: {e}")
+            return None
+
+        items = []
+        for line in lines:
+            try:
+                items.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                # Torn write from an unclean shutdown
+                logging.warning(f"Skipping corrupt record in {path.name}")
+        return len(lines), items
+
+    def _replay_segment(self, path: Path, line_count: int, items: List[Dict],
+                        max_batch: int) -> bool:
+        """
+        Sends one segment. On failure the segment is rewritten with only
+        the records that were not accepted.
+        """
+        for start in range(0, len(items), max_batch):
+            if not self._try_send(items[start:start + max_batch]):
+                self._rewrite_segment(path, items[start:])
+                self._discount_offline(line_count - (len(items) - start))
+                return False
+
+        path.unlink(missing_ok=True)
+        self._discount_offline(line_count)
+        return True
+
+    def _discount_offline(self, count: int):
+        with self._offline_lock:
+            self._offline_count -= count
+
+    def _rewrite_segment(self, path: Path, items: List[Dict]):
+        tmp_path = path.with_suffix('.tmp')
+        tmp_path.write_bytes(b''.join(orjson.dumps(item) + b'\n' for item in items))
+        os.replace(tmp_path, path)
+
+    def get_upload_stats(self) -> Dict:
+        """
+        Upload counters, queue depth and offline backlog size.
+        """
+        return {
+            **self.stats,
+            'queued': len(self.upload_queue),
+            'offline': self._offline_count,
+        }
 
     def cleanup(self):
         """
-        Wait for queue to empty and close connections.
+        Wait for queue to empty and close connections. Whatever the worker
+        could not reach in time is persisted to the offline buffer.
         """
-        # self.upload_queue.join()
-        ...
\ No newline at end of file
+        self._running = False
+        # Wake background threads instead of waiting out their timeouts
+        self._stopped.set()
+        self._queue_event.set()
+        self._refresh_requested.set()
+        if self._worker is not None:
+            self._worker.join(timeout=30)
+
+        # Worker still stuck on a request: the daemon thread dies at exit,
+        # so move the remaining queue to disk ourselves
+        leftover = []
+        while True:
+            try:
+                leftover.append(self.upload_queue.popleft())
+            except IndexError:
+                break
+        if leftover:
+            self._persist_batch(leftover)
+
+        self._rotate_offline()
+        self._session.close()
\ No newline at end of file
@@ -1,9 +1,25 @@
 #!/usr/bin/env python3
 
-from dataclasses import dataclass, field
-from typing import Dict
+import json
+import os
+from dataclasses import asdict, dataclass, field, fields
+from typing import Dict, List
 from pathlib import Path
 
+# Environment variable -> Config field
+ENV_OVERRIDES = {
+    'MODEL_PATH': 'model_path',
+    'TINY_MODEL_PATH': 'tiny_model_path',
+    'DETECTION_CONFIDENCE': 'confidence_threshold',
+    'BACKEND_URL': 'backend_url',
+    'BACKEND_USERNAME': 'backend_username',
+    'BACKEND_PASSWORD': 'backend_password',
+    'DEVICE_ID': 'device_id',
+}
+
+# BCM GPIO numbers usable on the Raspberry Pi header
+VALID_GPIO_PINS = frozenset(range(2, 28))
+
 @dataclass
 class Config:
     """
@@ -13,16 +29,63 @@ class Config:
     
     # --- Computer Vision ---
     model_path: str = "models/yolov8n_cbam.pt"
+    # Lighter variant run between sensor events, trained with a 'pothole'
+    # class ("" to always run the full model)
+    tiny_model_path: str = "models/yolov8n_pothole.pt"
+    # Seconds the full model stays active after a sensor trigger
+    full_model_hold: float = 2.0
     confidence_threshold: float = 0.25
+    iou_threshold: float = 0.45
+    # Most potholes kept per frame after NMS
+    max_det: int = 20
+    # Square inference size the model was trained/exported at
+    imgsz: int = 640
+    # Consecutive frames per forward pass (1 = lowest latency; >1 for GPU throughput)
+    inference_batch_size: int = 1
+    # Inference precision: 'fp32' (PyTorch), 'fp16' or 'int8' (exported runtime)
+    precision: str = "fp32"
+    # Dataset YAML of road frames used to calibrate INT8 TensorRT engines
+    calibration_data: str = ""
     
     # --- Hardware Mapping ---
     camera_id: int = 0
-    # Ultrasonic Pins (Trig, Echo)
-    sensor_pins: Dict[str, int] = field(default_factory=lambda: {'trig': 18, 'echo': 24})
+    camera_width: int = 640
+    camera_height: int = 480
+    camera_fps: int = 30
+    # Capture through libcamera/GStreamer when OpenCV supports it (else V4L2)
+    camera_gstreamer: bool = True
+    # Ultrasonic Pins (Trig, Echo) and vibration sensor input
+    sensor_pins: Dict[str, int] = field(
+        default_factory=lambda: {'trig': 18, 'echo': 24, 'vibration': 23}
+    )
+    # Status/alert LEDs by color
+    led_pins: Dict[str, int] = field(
+        default_factory=lambda: {'green': 25, 'red': 22, 'blue': 27, 'yellow': 17}
+    )
     
+    # Minimum seconds between two recorded detections
+    detection_cooldown: float = 2.0
+    # Detection records kept in memory (oldest evicted first)
+    history_cap: int = 1000
+    # Sensor indicators: look-back window (s) and how far (cm) a distance
+    # reading must exceed the window median to count as a dip
+    indicator_window: float = 1.0
+    pothole_depth_cm: float = 3.0
+
+    # --- Notifications ---
+    audio_enabled: bool = True
+    audio_device: str = "default"
+
     # --- Backend Integration ---
     api_endpoint: str = "https://api.pothole-monitor.com/v1"
     device_token: str = "dev_12345"
+    backend_url: str = "http://192.168.0.3:8080"
+    backend_username: str = ""
+    backend_password: str = ""
+    device_id: str = "pothole_detector_001"
+    # Upload batching: max detections per POST, max wait (seconds) for a batch
+    upload_batch_size: int = 50
+    upload_interval: float = 1.0
 
     @classmethod
     def load(cls, path: str = "config.json") -> 'Config':
@@ -32,11 +95,88 @@ class Config:
         # Check if file exists
         # Read JSON
         # Validate critical fields
-        return cls()
+        config = cls()
+        config.update_from_env()
+        return config
 
-    def save(self):
+    def update_from_env(self):
+        """
+        Applies ENV_OVERRIDES from the process environment.
+        """
+        type(self)._env_parser()(self)
+
+    @classmethod
+    def _env_parser(cls):
+        """
+        Generates (once per class) a straight-line parser for ENV_OVERRIDES
+        with the type conversion for each field resolved up front.
+        """
+        parser = cls.__dict__.get('_compiled_env_parser')
+        if parser is not None:
+            return parser
+
+        field_types = {f.name: f.type for f in fields(cls)}
+        lines = ["def update_from_env(self):"]
+        for env_var, name in ENV_OVERRIDES.items():
+            field_type = field_types[name]
+            if field_type not in (str, int, float):
+                raise TypeError(f"Unsupported type for env override {env_var}: {field_type}")
+            value = "v" if field_type is str else f"{field_type.__name__}(v)"
+            lines.append(f"    v = getenv({env_var!r})")
+            lines.append(f"    if v is not None: self.{name} = {value}")
+
+        namespace = {'getenv': os.getenv}
+        exec(compile("\n".join(lines), "<config-env-parser>", "exec"), namespace)
+        cls._compiled_env_parser = namespace['update_from_env']
+        return cls._compiled_env_parser
+
+    def __post_init__(self):
+        self._saved_path = None
+
+    def __setattr__(self, name, value):
+        # Any public field change invalidates the cached save/validate results.
+        # In-place edits (e.g. sensor_pins['trig'] = 5) are not seen: reassign.
+        object.__setattr__(self, name, value)
+        if not name.startswith('_'):
+            object.__setattr__(self, '_dirty', True)
+            object.__setattr__(self, '_validation_cache', None)
+
+    def validate(self) -> List[str]:
+        """
+        Returns a list of configuration problems (empty when valid).
+        Memoized until a field is reassigned; each call gets its own list.
+        """
+        if self._validation_cache is not None:
+            return list(self._validation_cache)
+
+        errors = []
+        if not Path(self.model_path).exists():
+            errors.append(f"Model file not found: {self.model_path}")
+        if self.precision not in ('int8', 'fp16', 'fp32'):
+            errors.append(f"Unsupported precision: {self.precision}")
+        if not 0.0 <= self.confidence_threshold <= 1.0:
+            errors.append(f"confidence_threshold out of range: {self.confidence_threshold}")
+        for name, pin in {**self.sensor_pins, **self.led_pins}.items():
+            if pin not in VALID_GPIO_PINS:
+                errors.append(f"Invalid GPIO pin for {name}: {pin}")
+        if not self.backend_url:
+            errors.append("backend_url is not set")
+        if self.upload_batch_size < 1:
+            errors.append(f"upload_batch_size must be positive: {self.upload_batch_size}")
+
+        self._validation_cache = tuple(errors)
+        return errors
+
+    def save(self, path: str = "config.json"):
         """
         Persists current runtime configuration to disk.
+        Skipped when nothing changed since the last save to the same path.
         """
+        if not self._dirty and self._saved_path == path:
+            return
+
         # Serialize to JSON
-        ...
\ No newline at end of file
+        with open(path, 'w') as f:
+            json.dump(asdict(self), f, indent=2)
+        self._dirty = False
+        self._saved_path = path
\ No newline at end of file
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Offline export of the YOLOv8n-CBAM weights to reduced-precision artifacts.
+
+The detector picks these up when `precision` in config.json is 'int8' or
+'fp16' (see PotholeDetector._resolve_model_path):
+    models/yolov8n_cbam_int8.onnx           CPU (ONNX Runtime, static INT8)
+    models/yolov8n_cbam_int8_<gpu>.engine   NVIDIA (TensorRT INT8)
+    models/yolov8n_cbam_fp16_<gpu>.engine   NVIDIA (TensorRT FP16)
+Engines are built by the detector on first load if missing; running this
+script on the target ahead of time avoids that startup delay.
+"""
+
+import argparse
+import re
+import shutil
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+
+from ultralytics import YOLO
+
+
+class RoadFrameCalibrationReader:
+    """
+    Feeds representative road frames (200-500 recommended) to the
+    ONNX Runtime static quantizer.
+    """
+
+    def __init__(self, image_dir: str, input_name: str, imgsz: int):
+        self.paths = sorted(
+            p for p in Path(image_dir).iterdir() if p.suffix.lower() in ('.jpg', '.jpeg', '.png')
+        )
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self._iter = iter(self.paths)
+
+    def get_next(self):
+        for path in self._iter:
+            frame = cv2.imread(str(path))
+            if frame is None:
+                continue
+            # Same preprocessing as PotholeDetector._prepare_input: letterboxed
+            # (aspect kept, centred, padded with 114), RGB, CHW, 0-1
+            imgsz = self.imgsz
+            height, width = frame.shape[:2]
+            scale = min(imgsz / width, imgsz / height)
+            new_w, new_h = round(width * scale), round(height * scale)
+            left, top = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+            padded = np.full((imgsz, imgsz, 3), 114, np.uint8)
+            padded[top:top + new_h, left:left + new_w] = cv2.resize(frame, (new_w, new_h))
+            blob = padded[:, :, ::-1].transpose(2, 0, 1)[None].astype(np.float32) / 255.0
+            return {self.input_name: blob}
+        return None
+
+
+def export_onnx_int8(weights: Path, calib_dir: str, imgsz: int) -> Path:
+    import onnxruntime
+    from onnxruntime.quantization import QuantType, quantize_static
+
+    # 1. Export FP32 ONNX graph
+    #    (dynamic batch so the detector can run partial batches)
+    fp32_path = Path(YOLO(str(weights)).export(format='onnx', imgsz=imgsz, simplify=True, dynamic=True))
+
+    # 2. Calibrate and quantize weights and activations to INT8
+    input_name = onnxruntime.InferenceSession(
+        str(fp32_path), providers=['CPUExecutionProvider']
+    ).get_inputs()[0].name
+    output_path = weights.with_name(f"{weights.stem}_int8.onnx")
+    quantize_static(
+        str(fp32_path),
+        str(output_path),
+        RoadFrameCalibrationReader(calib_dir, input_name, imgsz),
+        weight_type=QuantType.QInt8,
+        activation_type=QuantType.QUInt8,
+    )
+    return output_path
+
+
+def engine_path(weights: Path, precision: str) -> Path:
+    # TensorRT engines only run on the GPU model they were built for
+    gpu = re.sub(r'[^a-z0-9]+', '-', torch.cuda.get_device_name(0).lower()).strip('-')
+    return weights.with_name(f"{weights.stem}_{precision}_{gpu}.engine")
+
+
+def export_engine(weights: Path, precision: str, calib_data: str, imgsz: int,
+                  batch: int = 1) -> Path:
+    # Ultralytics drives trtexec; INT8 calibrates on the dataset YAML.
+    # dynamic=True builds a 1..batch profile, so partial batches are valid
+    exported = YOLO(str(weights)).export(
+        format='engine',
+        imgsz=imgsz,
+        batch=batch,
+        dynamic=True,
+        half=precision == 'fp16',
+        int8=precision == 'int8',
+        data=calib_data if precision == 'int8' else None,
+        device=0,
+    )
+    output_path = engine_path(weights, precision)
+    shutil.move(exported, output_path)
+    return output_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export reduced-precision pothole model")
+    parser.add_argument('--weights', default="models/yolov8n_cbam.pt")
+    parser.add_argument('--format', choices=['onnx', 'engine'], default='onnx')
+    parser.add_argument('--precision', choices=['int8', 'fp16'], default='int8')
+    parser.add_argument('--calib', required=True,
+                        help="Image directory (onnx) or dataset YAML (engine) of road frames")
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--batch', type=int, default=1,
+                        help="Engine batch size (match inference_batch_size)")
+    args = parser.parse_args()
+
+    weights = Path(args.weights)
+    if args.format == 'onnx':
+        if args.precision != 'int8':
+            parser.error("ONNX export is INT8 only; use --format engine for fp16")
+        output_path = export_onnx_int8(weights, args.calib, args.imgsz)
+    else:
+        output_path = export_engine(weights, args.precision, args.calib, args.imgsz, args.batch)
+
+    print(f"Exported {output_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,8 @@
 import time
 import threading
 import logging
-from datetime import datetime
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 import json
 
@@ -15,20 +16,39 @@ from backend_client import BackendClient
 from config import Config
 
 # Initialize Logging
-# logger = logging.getLogger(__name__)
+logger = logging.getLogger(__name__)
 
 class PotholeDetectionSystem:
     
     def __init__(self):
         # 1. Initialize Configuration
+        self.config = Config.load()
+
         # 2. Set initializing flag
+        self.running = False
+
         # 3. Instantiate subsystems:
-        #    - PotholeDetector
-        #    - SensorManager
-        #    - NotificationSystem
-        #    - BackendClient
+        self.detector = PotholeDetector(self.config)
+        self.sensors = SensorManager(self.config)
+        self.notifications = NotificationSystem(self.config)
+        self.backend = BackendClient(self.config)
+
         # 4. Initialize state variables (history, timers)
-        pass
+        # Bounded: old records are evicted on long drives instead of growing forever
+        self.detection_history = deque(maxlen=self.config.history_cap)
+        self.detection_count = 0
+        self.last_detection_time = 0.0
+        # Most recent inference result, reused by consumers between inferences
+        self._last_detections = []
+
+        # 5. Pipeline gauges: frames captured/inferred/dropped, inference latency EWMA (s)
+        self._stats = {'cap': 0, 'inf': 0, 'drop': 0, 'lat_ewma': 0.0}
+        self._stats_interval = 10.0
+
+        # 6. Disk I/O for positive detections runs off the inference thread
+        self._io_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix='io')
+        self.image_dir = Path("detections")
+        self.image_dir.mkdir(exist_ok=True)
     
     def start(self):
         # 1. Log system start
@@ -42,64 +62,204 @@ class PotholeDetectionSystem:
     
     def stop(self):
         # 1. Log stopping sequence
+        logger.info("Stopping pothole detection system")
+
         # 2. Set running flag to False
-        # 3. Cleanup all subsystems
+        self.running = False
+
+        # 3. Finish pending image writes, then cleanup all subsystems
+        self._io_pool.shutdown(wait=True)
+        self.detector.cleanup()
+        self.sensors.cleanup()
+        self.notifications.cleanup()
+        self.backend.cleanup()
+
         # 4. Log system stopped
-        pass
+        logger.info("Pothole detection system stopped")
     
     def _sensor_monitor_loop(self):
         # Loop while running:
-        #   1. Check pothole indicators from sensors (vibration, ultrasonic)
+        #   1. Sleep until the sensor thread/ISR signals an indicator
+        #      (the timeout only bounds shutdown latency)
         #   2. If indicator detected (vibration or low distance):
         #      - Log detection
         #      - Trigger immediate camera detection
-        #   3. Sleep for short interval
-        pass
+        indicator_event = self.sensors.indicator_event
+        check_indicators = self.sensors.check_pothole_indicators
+        trigger = self._trigger_detection
+        while self.running:
+            if not indicator_event.wait(timeout=1.0):
+                continue
+            indicator_event.clear()
+
+            indicators = check_indicators()
+            if indicators['vibration'] or indicators['ultrasonic']:
+                if logger.isEnabledFor(logging.INFO):
+                    logger.info("Sensor pothole indicator: %s", indicators)
+                trigger("sensor_trigger")
     
     def _main_detection_loop(self):
         # Loop while running:
-        #   1. Capture frame from camera
-        #   2. If valid frame and interval met:
-        #      - Process frame for potholes
-        #   3. Sleep to maintain loop rate
-        pass
+        #   1. Capture the next batch of fresh frames (one frame unless batching)
+        #   2. If any: run them through the model in one forward pass
+        #   No sleep: inference is far slower than the camera, so capturing
+        #   right after each inference always feeds the model fresh frames
+        #   3. Every _stats_interval seconds, log the pipeline gauges
+        capture_batch = self.detector.capture_batch
+        batch_size = self.detector.batch_size
+        process_batch = self._process_batch
+        sleep = time.sleep
+        monotonic = time.monotonic
+        next_stats = monotonic() + self._stats_interval
+        while self.running:
+            frames = capture_batch(batch_size)
+            if not frames:
+                sleep(0.1)
+                continue
+            process_batch(frames)
+
+            if monotonic() >= next_stats:
+                self._log_stats()
+                next_stats += self._stats_interval
     
     def _trigger_detection(self, trigger_source):
-        # 1. Capture single frame
-        # 2. Process frame with specific trigger source
-        pass
+        # 1. Sensor events are high-prior frames: run the full CBAM model on them
+        if trigger_source == "sensor_trigger":
+            self.detector.set_active('full')
+
+        # 2. Capture single frame
+        frame = self.detector.capture_frame()
+
+        # 3. Process frame with specific trigger source
+        if frame is not None:
+            self._process_frame(frame, trigger_source)
     
     def _process_frame(self, frame, trigger_source="camera"):
-        # 1. Run YOLO inference on frame
-        # 2. If potholes detected:
+        self._process_batch([frame], trigger_source)
+
+    def _process_batch(self, frames, trigger_source="camera"):
+        # 1. Run YOLO inference on all frames at once, tracking per-frame latency
+        started = time.monotonic()
+        results = self.detector.detect_batch(frames)
+        self._record_inference(time.monotonic() - started, len(frames))
+
+        # 2. Handle each frame's result in capture order
+        for frame, (detections, confidence) in zip(frames, results):
+            self._handle_frame_result(frame, detections, confidence, trigger_source)
+
+    def _handle_frame_result(self, frame, detections, confidence, trigger_source):
+        self._last_detections = detections
+
+        # 1. If potholes detected:
+        if not detections:
+            return
+
         #    - Check if enough time passed since last detection
+        timestamp_ns = time.time_ns()
+        now = timestamp_ns / 1e9
+        if now - self.last_detection_time < self.config.detection_cooldown:
+            return
+
         #    - Get current sensor readings (GPS, ultrasound, etc.)
+        sensor_data = self.sensors.get_current_readings()
+
         #    - Create detection record object
+        detection_record = {
+            # Integer ns; formatted only where a string is needed (upload, filename)
+            'timestamp_ns': timestamp_ns,
+            'trigger_source': trigger_source,
+            'detections': detections,
+            'confidence': confidence,
+            'sensor_data': sensor_data,
+            'location': sensor_data.get('gps'),
+        }
+
         #    - Handle the positive detection
+        self._handle_pothole_detection(detection_record, frame)
+
         #    - Update last detection timestamp
-        pass
+        self.last_detection_time = now
     
-    def _handle_pothole_detection(self, detection_record):
+    def _record_inference(self, latency, frames=1):
+        stats = self._stats
+        latency /= frames
+        if stats['inf'] == 0:
+            stats['lat_ewma'] = latency
+        else:
+            stats['lat_ewma'] = 0.9 * stats['lat_ewma'] + 0.1 * latency
+        stats['inf'] += frames
+
+    def _refresh_stats(self):
+        # Capture counters live on the detector's capture thread
+        stats = self._stats
+        stats['cap'], stats['drop'] = self.detector.get_frame_counts()
+        return stats
+
+    def _log_stats(self):
+        stats = self._refresh_stats()
+        logger.info(
+            f"Pipeline: captured={stats['cap']} inferred={stats['inf']} dropped={stats['drop']} "
+            f"latency={stats['lat_ewma'] * 1000:.1f}ms "
+            f"notify_queue={self.notifications.notification_queue.qsize()}"
+        )
+
+    def _handle_pothole_detection(self, detection_record, frame=None):
         # 1. Log detection confidence
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "Pothole detected (%s), confidence %.2f",
+                detection_record['trigger_source'], detection_record['confidence'],
+            )
+
         # 2. Add to local history
-        # 3. Trigger notification system (audio/display)
-        # 4. Upload detection to backend
-        # 5. Save detection image locally
-        pass
+        self.detection_history.append(detection_record)
+        self.detection_count += 1
+
+        # 3. Trigger notification system (audio/display); queued, returns at once
+        self.notifications.notify_pothole_detected(detection_record)
+
+        # 4. Upload detection to backend; enqueued for the batching uploader
+        self.backend.upload_detection(detection_record)
+
+        # 5. Save detection image locally, off the inference thread
+        future = self._io_pool.submit(self._save_detection_image, detection_record, frame)
+        future.add_done_callback(self._log_io_failure)
+
+    @staticmethod
+    def _log_io_failure(future):
+        if future.exception() is not None:
+            logger.error(f"Background I/O failed: {future.exception()}")
     
-    def _save_detection_image(self, detection_record):
-        # 1. Generate filename with timestamp
-        # 2. Ensure directory exists
-        # 3. Save annotated image using detector
+    def _save_detection_image(self, detection_record, frame=None):
+        # 1. Generate filename from the record's own timestamp
+        seconds, nanos = divmod(detection_record['timestamp_ns'], 1_000_000_000)
+        filename = f"pothole_{time.strftime('%Y%m%d_%H%M%S', time.localtime(seconds))}_{nanos // 1000:06d}.jpg"
+
+        # 2. Directory is created once in __init__
+
+        # 3. Save annotated image (of the frame that was detected on) using detector
+        image_path = self.image_dir / filename
+        self.detector.save_detection_image(str(image_path), detection_record['detections'], frame)
+
         # 4. Update record with image path
-        pass
+        detection_record['image_path'] = str(image_path)
     
     def get_system_status(self):
         # Return dictionary with:
         # - Running state
         # - Detection counts
         # - Subsystem statuses
-        return {}
+        last_detection = self.detection_history[-1] if self.detection_history else None
+        return {
+            'running': self.running,
+            'total_detections': self.detection_count,
+            'recent_detections': len(self.detection_history),
+            'last_detection_ns': last_detection['timestamp_ns'] if last_detection else None,
+            'pipeline': dict(self._refresh_stats()),
+            'notification_queue': self.notifications.notification_queue.qsize(),
+            'detector': self.detector.get_status(),
+            'backend': self.backend.get_upload_stats(),
+        }
 
 def main():
     # 1. Create PotholeDetectionSystem instance
@@ -1,9 +1,41 @@
 #!/usr/bin/env python3
 
 import logging
+import queue
 import threading
 from typing import Dict, Any
 
+import alsaaudio
+import numpy as np
+from gpiozero import GPIOZeroError, PWMLED
+
+SAMPLE_RATE = 22050
+
+# Sound type -> (frequency Hz, beep seconds, beep count)
+SOUND_PATTERNS = {
+    'startup': (800, 0.2, 1),
+    'status': (1500, 0.1, 1),
+    'alert': (2000, 0.3, 1),
+    'error': (1000, 0.2, 3),
+}
+
+# Status -> LED color lit while in that status (red is reserved for pothole alerts)
+STATUS_LEDS = {
+    'ok': 'green',
+    'busy': 'blue',
+    'offline': 'yellow',
+    'error': 'yellow',
+}
+
+def _render_tone(frequency: float, duration: float, count: int) -> bytes:
+    """
+    Mono S16_LE PCM for `count` beeps separated by short silences.
+    """
+    t = np.arange(int(SAMPLE_RATE * duration)) / SAMPLE_RATE
+    beep = (np.sin(2 * np.pi * frequency * t) * 32767 * 0.5).astype(np.int16)
+    gap = np.zeros(int(SAMPLE_RATE * 0.2), dtype=np.int16)
+    return np.concatenate([beep, gap] * count).tobytes()
+
 class NotificationSystem:
     """
     Manages local feedback to the user via Audio output and LED indicators.
@@ -16,62 +48,216 @@ class NotificationSystem:
         """
         self.config = config
         self.audio_enabled = config.audio_enabled
-        self.queue = []
+        self.audio_device = config.audio_device
+        self._pcm = None
+        self._pcm_buffers = {}
+        # Sounds to play; a dedicated thread does the blocking PCM writes
+        self._audio_queue = queue.Queue(maxsize=4)
+        self._audio_thread = None
+
+        # Color -> BCM pin; PWMLED objects are created once in _setup_leds
+        self.led_pins = config.led_pins
+        self._leds = {}
+        self.display_state = None
+        self._last_gpio_state = {}  # status LED color -> last level written
+
+        # Bounded FIFO drained by the notification worker; producers never block
+        self.notification_queue = queue.Queue(maxsize=256)
+        self.running = False
+        self._worker = None
 
     def initialize(self):
         """
         Test indicators and play startup sound.
         """
+        self.running = True
         if self.audio_enabled:
-            # check_audio_driver()
-            ...
-        # setup_gpio_leds()
-        ...
+            self._initialize_audio()
+            self._play_sound('startup')
+        self._setup_leds()
+
+        self._worker = threading.Thread(target=self._notification_loop, daemon=True)
+        self._worker.start()
 
     def notify_pothole_detected(self, context: Dict):
         """
         Triggers the "Pothole Detected" alert sequence.
         """
-        # 1. Play Alert Sound
-        self._play_sound("alert.wav")
-        
-        # 2. Flash Detection LED
-        self._flash_led("red", duration=2.0)
-        
-        logging.info("Visual/Audio Alert Triggered")
+        self._enqueue({'type': 'pothole', 'data': context})
 
     def notify_status(self, status: str):
         """
         Updates the system status LED (e.g., Green=OK, Red=Error).
         """
-        # gpio.output(status_led, HIGH/LOW)
-        ...
+        self._enqueue({'type': 'status', 'data': status})
 
     def notify_error(self, message: str):
         """
         Alerts internal system error.
         """
+        self._enqueue({'type': 'error', 'data': message})
+
+    def _enqueue(self, notification: Dict[str, Any]):
+        """
+        Non-blocking put; when the queue is full the oldest entry is dropped.
+        """
+        while True:
+            try:
+                self.notification_queue.put_nowait(notification)
+                return
+            except queue.Full:
+                try:
+                    self.notification_queue.get_nowait()
+                except queue.Empty:
+                    pass
+
+    def _notification_loop(self):
+        """
+        Worker: blocks on the queue, so alerts are handled as soon as they
+        are posted; the timeout only bounds shutdown.
+        """
+        get = self.notification_queue.get
+        process = self._process_notification
+        while self.running:
+            try:
+                notification = get(timeout=0.5)
+            except queue.Empty:
+                continue
+            # Device failures are expected and logged briefly; anything else
+            # is a bug, logged with its traceback, but must not stop alerts
+            try:
+                process(notification)
+            except (OSError, RuntimeError, alsaaudio.ALSAAudioError, GPIOZeroError) as e:
+                logging.error(f"Notification failed: {e}")
+            except Exception:
+                logging.exception("Unexpected error while processing notification")
+
+    def _process_notification(self, notification: Dict[str, Any]):
+        handlers = {
+            'pothole': self._handle_pothole_notification,
+            'status': self._handle_status_notification,
+            'error': self._handle_error_notification,
+        }
+        handlers[notification['type']](notification['data'])
+
+    def _handle_pothole_notification(self, context: Dict):
+        # 1. Play Alert Sound
+        self._play_sound('alert')
+        
+        # 2. Flash Detection LED
+        self._flash_led("red", duration=2.0)
+        
+        logging.info("Visual/Audio Alert Triggered")
+
+    def _handle_status_notification(self, status: str):
+        self._update_display_status(status)
+
+    def _handle_error_notification(self, message: str):
         # Log error
+        logging.error(f"System error: {message}")
+
         # Play fail sound
-        ...
+        self._play_sound('error')
+
+    def _initialize_audio(self):
+        """
+        Render every sound once and keep a single PCM device open, so an
+        alert is one write() instead of spawning a player process.
+        """
+        self._pcm_buffers = {
+            sound_type: _render_tone(*pattern)
+            for sound_type, pattern in SOUND_PATTERNS.items()
+        }
+        try:
+            self._pcm = alsaaudio.PCM(
+                type=alsaaudio.PCM_PLAYBACK,
+                device=self.audio_device,
+                channels=1,
+                rate=SAMPLE_RATE,
+                format=alsaaudio.PCM_FORMAT_S16_LE,
+            )
+        except alsaaudio.ALSAAudioError as e:
+            logging.warning(f"Audio disabled, cannot open '{self.audio_device}': {e}")
+            self.audio_enabled = False
+            return
+
+        # write() blocks for as long as the tone lasts (up to 1.2 s for
+        # 'error'), so playback gets its own thread
+        self._audio_thread = threading.Thread(target=self._audio_loop, daemon=True)
+        self._audio_thread.start()
 
-    def _play_sound(self, filename: str):
+    def _play_sound(self, sound_type: str):
         """
-        Subprocess call to 'aplay' or 'mpg321'.
+        Queues a pre-rendered buffer for the audio thread and returns at once;
+        sounds are dropped while a backlog is already waiting.
         """
-        # subprocess.run(["aplay", filename])
-        ...
+        if not self.audio_enabled or self._pcm is None:
+            return
+        try:
+            self._audio_queue.put_nowait(self._pcm_buffers[sound_type])
+        except queue.Full:
+            pass
 
-    def _flash_led(self, color: str, duration: float):
+    def _audio_loop(self):
         """
-        Async LED blink pattern.
+        Audio worker: plays queued buffers on the open PCM device in order.
         """
-        # threading.Thread(... blink logic ...).start()
-        ...
+        while self.running:
+            try:
+                buffer = self._audio_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                self._pcm.write(buffer)
+            except alsaaudio.ALSAAudioError as e:
+                logging.error(f"Audio playback failed: {e}")
+
+    def _setup_leds(self):
+        self._leds = {color: PWMLED(pin) for color, pin in self.led_pins.items()}
+
+    def _update_display_status(self, status: str):
+        """
+        Lights the LED mapped to `status` and turns the other status LEDs off.
+        Only LEDs whose level changed since the last update are written.
+        """
+        self.display_state = status
+        lit = STATUS_LEDS.get(status)
+        desired = {color: color == lit for color in set(STATUS_LEDS.values()) if color in self._leds}
+        for color, level in desired.items():
+            if self._last_gpio_state.get(color) == level:
+                continue
+            if level:
+                self._leds[color].on()
+            else:
+                self._leds[color].off()
+        self._last_gpio_state = desired
+
+    def _flash_led(self, color: str, duration: float, frequency: float = 2.5):
+        """
+        Async LED blink pattern: gpiozero toggles the LED on its own
+        background thread, so the notification worker returns immediately.
+        A repeat flash on a blinking LED restarts the blink.
+        """
+        half_period = 0.5 / frequency
+        self._leds[color].blink(
+            on_time=half_period,
+            off_time=half_period,
+            n=max(1, round(duration * frequency)),
+            background=True,
+        )
 
     def cleanup(self):
         """
         Turn off all indicators.
         """
-        # gpio.cleanup()
-        ...
\ No newline at end of file
+        self.running = False
+        if self._worker is not None:
+            self._worker.join(timeout=1.0)
+        if self._audio_thread is not None:
+            self._audio_thread.join(timeout=2.0)
+        if self._pcm is not None:
+            self._pcm.close()
+
+        for led in self._leds.values():
+            led.close()
+        self._leds.clear()
\ No newline at end of file
@@ -1,71 +1,553 @@
 #!/usr/bin/env python3
 
 import cv2
+import numba
 import numpy as np
 import logging
+import re
+import threading
+import time
+import torch
+import torch.nn.functional as F
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
-# Pseudocode dependencies
-# from ultralytics import YOLO
+from ultralytics import YOLO
+from ultralytics.utils.ops import non_max_suppression
+
+from export_model import engine_path, export_engine
+
+logger = logging.getLogger(__name__)
+# Ultralytics logs a summary line per predict() call; keep only warnings
+logging.getLogger('ultralytics').setLevel(logging.WARNING)
+
+JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 80, cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+BOX_COLOR = (0, 0, 255)  # BGR
+BOX_THICKNESS = 2
+
+
+@numba.njit(cache=True)
+def _decode_njit(raw, conf_thr):
+    """
+    Single pass over the (N, 6) [x1, y1, x2, y2, conf, cls] result rows.
+    Keeps rows at or above `conf_thr`, returned as (boxes, scores, classes,
+    max_conf); max_conf is 0.0 when nothing is kept.
+    """
+    n = raw.shape[0]
+    out_boxes = np.empty((n, 4), np.float32)
+    out_scores = np.empty(n, np.float32)
+    out_classes = np.empty(n, np.int32)
+    count = 0
+    max_conf = 0.0
+    for i in range(n):
+        if raw[i, 4] >= conf_thr:
+            if raw[i, 4] > max_conf:
+                max_conf = raw[i, 4]
+            out_boxes[count, 0] = raw[i, 0]
+            out_boxes[count, 1] = raw[i, 1]
+            out_boxes[count, 2] = raw[i, 2]
+            out_boxes[count, 3] = raw[i, 3]
+            out_scores[count] = raw[i, 4]
+            out_classes[count] = np.int32(raw[i, 5])
+            count += 1
+    return out_boxes[:count], out_scores[:count], out_classes[:count], max_conf
+
+
+def _gstreamer_available() -> bool:
+    """True if this OpenCV build was compiled with GStreamer support."""
+    match = re.search(r"GStreamer:\s*(\w+)", cv2.getBuildInformation())
+    return bool(match) and match.group(1) == 'YES'
+
+
+@dataclass
+class Detections:
+    """Per-frame detections as parallel arrays (boxes: (N, 4) xyxy)."""
+    boxes: np.ndarray
+    scores: np.ndarray
+    classes: np.ndarray
+    names: Dict[int, str] = field(default_factory=dict)
+
+    def __len__(self) -> int:
+        return len(self.scores)
+
+    def to_dicts(self) -> List[Dict]:
+        """
+        Materializes one dict per detection (JSON boundary only).
+        """
+        return [
+            {
+                'bbox': bbox,
+                'confidence': score,
+                'class_id': class_id,
+                'class_name': self.names.get(class_id, str(class_id)),
+            }
+            for bbox, score, class_id in zip(
+                self.boxes.tolist(), self.scores.tolist(), self.classes.tolist()
+            )
+        ]
 
-# logger = logging.getLogger(__name__)
 
 class PotholeDetector:
-    
+
     def __init__(self, config):
         # 1. Store config
-        # 2. Set detection thresholds from config
+        self.config = config
+
+        # 2. Set detection thresholds from config; they are fixed for the run,
+        #    so the NMS settings are built once
+        self.confidence_threshold = config.confidence_threshold
+        self.iou_threshold = config.iou_threshold
+        self._nms_settings = {
+            'conf': self.confidence_threshold,
+            'iou': self.iou_threshold,
+            'max_det': config.max_det,
+        }
+
         # 3. Determine device (CPU/GPU)
+        self.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+
         # 4. Initialize model and camera placeholders
-        pass
-    
+        #    (self.model points at the active entry of self.models)
+        self.models = {}
+        self.model = None
+        self.active = None
+        self.pothole_class_idx = None
+        self._nms_classes = None
+        self._full_until = 0.0
+        self.camera = None
+
+        # 5. Latest-frame slot filled by the capture thread
+        self._frame_cond = threading.Condition()
+        self._latest_frame = None
+        self._frame_seq = 0  # frames captured
+        self._read_seq = 0   # last frame handed out by capture_frame
+        self._frames_dropped = 0  # captured frames overwritten before being read
+        self._capturing = False
+        self._capture_thread = None
+
+        # 6. Reusable letterboxed input batch (sized by _configure_input); the
+        #    lock serializes inference between the detection and sensor threads
+        self.batch_size = max(1, config.inference_batch_size)
+        # FP16 inputs and weights on CUDA (Tensor Core math)
+        self._half = self.device == 'cuda' and config.precision == 'fp16'
+        self._infer_lock = threading.Lock()
+        self._in_src_shape = None
+        self._in_box = None
+        self._in_resized = None
+        self._in_view = None
+        self._in_hwc = None
+        self._in_nchw = None
+        self._in_tensor = None
+        self._in_frames = None
+        self._in_frames_np = None
+        self._d_frames = None
+        self._d_input = None
+        self._in_offset = None
+        self._in_scale = 1.0
+
     def initialize(self):
         # 1. Load the YOLOv8-CBAM model
-        # 2. Initialize the camera (detect available index)
-        # 3. Throw exception if initialization fails
-        pass
-    
+        self._load_model()
+
+        # 2. Compile the decode kernel now rather than on the first frame
+        _decode_njit(np.zeros((1, 6), np.float32), 1.0)
+
+        # 3. Initialize the camera (detect available index)
+        # 4. Throw exception if initialization fails
+        self._initialize_camera()
+        self._configure_input(self.config.camera_height, self.config.camera_width)
+
+        # 5. Capture on a dedicated thread so camera I/O overlaps inference
+        self._capturing = True
+        self._capture_thread = threading.Thread(target=self._capture_worker, daemon=True)
+        self._capture_thread.start()
+
     def cleanup(self):
-        # 1. Release camera resource
-        pass
-    
+        # 1. Stop the capture thread
+        self._capturing = False
+        if self._capture_thread is not None:
+            self._capture_thread.join(timeout=1.0)
+
+        # 2. Release camera resource
+        if self.camera is not None:
+            self.camera.release()
+            self.camera = None
+
     def _load_model(self):
-        # 1. Verify model file exists
-        # 2. Load model using ultralytics YOLO
-        # 3. Move model to appropriate device (CUDA/CPU)
-        pass
-    
+        # 1. Preload the full CBAM model and the tiny variant; switching between
+        #    them at runtime is then just a pointer swap
+        self.models['full'] = self._load_weights(Path(self.config.model_path))
+        tiny_path = self.config.tiny_model_path
+        if tiny_path and Path(tiny_path).exists():
+            tiny = self._load_weights(Path(tiny_path))
+            # A stock (e.g. COCO) checkpoint would report every class as a pothole
+            if 'pothole' in tiny.names.values():
+                self.models['tiny'] = tiny
+            else:
+                logger.warning(f"Tiny model {tiny_path} has no 'pothole' class; running full model only")
+        elif tiny_path:
+            logger.warning(f"Tiny model not found at {tiny_path}; running full model only")
+
+        # 2. Start on the cheapest model available
+        self._activate('tiny' if 'tiny' in self.models else 'full')
+
+    def _load_weights(self, weights: Path) -> YOLO:
+        # 1. Verify model file exists (quantized export if configured)
+        model_path = self._resolve_model_path(weights)
+        if not model_path.exists():
+            raise FileNotFoundError(f"Model file not found: {model_path}")
+
+        # 2. Load model using ultralytics YOLO (dispatches .engine/.onnx to TensorRT/ONNX Runtime)
+        model = YOLO(str(model_path), task='detect')
+
+        # 3. Move model to appropriate device (CUDA/CPU); exported runtimes pick their own provider
+        if model_path.suffix == '.pt':
+            model.to(self.device)
+
+        # 4. Fixed thresholds become model defaults rather than per-call kwargs
+        model.overrides.update(self._nms_settings)
+        model.overrides['verbose'] = False
+
+        # 5. One warm-up predict builds the predictor and its backend, which
+        #    detect_batch then calls directly; half=True converts PyTorch weights
+        #    to FP16 (engines keep the precision they were built with)
+        imgsz = self.config.imgsz
+        model.predict(np.zeros((imgsz, imgsz, 3), np.uint8), device=self.device, half=self._half)
+        return model
+
+    def _activate(self, name: str):
+        self.active = name
+        self.model = self.models[name]
+        # Resolved once per switch; None (no 'pothole' class) keeps every class
+        self.pothole_class_idx = {v: k for k, v in self.model.names.items()}.get('pothole')
+        self._nms_classes = None if self.pothole_class_idx is None else [self.pothole_class_idx]
+
+    def set_active(self, name: str):
+        """
+        Switches inference to the 'full' or 'tiny' model. 'full' is held for
+        config.full_model_hold seconds, then detect_potholes reverts to 'tiny'.
+        """
+        if name not in ('full', 'tiny'):
+            raise ValueError(f"Unknown model variant: {name}")
+        if name == 'full':
+            self._full_until = time.monotonic() + self.config.full_model_hold
+        if name in self.models:
+            # Not mid-batch: detect_batch reads the model and its classes together
+            with self._infer_lock:
+                self._activate(name)
+
+    def _resolve_model_path(self, weights: Path) -> Path:
+        # 1. fp32 runs the PyTorch weights as-is
+        # 2. int8/fp16 prefer the artifact written by export_model.py:
+        #    TensorRT engine on CUDA, ONNX Runtime graph on CPU
+        precision = self.config.precision
+        if precision not in ('int8', 'fp16', 'fp32'):
+            raise ValueError(f"Unsupported precision: {precision}")
+        if precision == 'fp32':
+            return weights
+
+        if self.device == 'cuda':
+            return self._ensure_engine(weights, precision)
+
+        exported = weights.with_name(f"{weights.stem}_{precision}.onnx")
+        if exported.exists():
+            return exported
+
+        logger.warning(f"No {precision} export at {exported}; using {weights}")
+        return weights
+
+    def _ensure_engine(self, weights: Path, precision: str) -> Path:
+        # 1. Engines are cached next to the weights, one per GPU model
+        exported = engine_path(weights, precision)
+        if exported.exists():
+            return exported
+
+        # 2. Otherwise build it once now (takes minutes); INT8 needs calibration frames
+        if not weights.exists():
+            return weights
+        if precision == 'int8' and not self.config.calibration_data:
+            logger.warning(f"No calibration_data for an INT8 engine; using {weights}")
+            return weights
+        logger.info(f"Building TensorRT {precision} engine {exported}")
+        try:
+            return export_engine(
+                weights, precision, self.config.calibration_data,
+                self.config.imgsz, self.batch_size,
+            )
+        except Exception as e:
+            logger.warning(f"TensorRT export failed ({e}); using {weights}")
+            return weights
+
     def _initialize_camera(self):
-        # 1. Try connecting to default camera indices (0, 1)
-        # 2. If connected, set resolution and FPS
-        pass
-    
-    def capture_frame(self) -> Optional[np.ndarray]:
-        # 1. Read frame from camera
-        # 2. Return frame if successful, else None
-        return None
-    
-    def detect_potholes(self, frame: np.ndarray) -> List[Dict]:
-        # 1. Run inference on frame using loaded model
-        # 2. Filter results by confidence and IoU thresholds
-        # 3. Parse bounding boxes and confidence scores
-        # 4. Return list of detections dictionaries
-        return []
-    
-    def save_detection_image(self, image_path: str, detections: List[Dict]):
+        # 1. Prefer libcamera through GStreamer: the ISP demosaics and scales,
+        #    and appsink drops stale buffers instead of queueing them
+        camera = None
+        if self.config.camera_gstreamer and _gstreamer_available():
+            camera = cv2.VideoCapture(self._gstreamer_pipeline(), cv2.CAP_GSTREAMER)
+            if not camera.isOpened():
+                logger.warning("GStreamer camera pipeline failed; falling back to V4L2")
+                camera.release()
+                camera = None
+
+        # 2. Otherwise try connecting to default camera indices (configured first, then 0, 1)
+        if camera is None:
+            for index in dict.fromkeys((self.config.camera_id, 0, 1)):
+                camera = cv2.VideoCapture(index)
+                if camera.isOpened():
+                    break
+                camera.release()
+            else:
+                raise RuntimeError("No camera available")
+
+            # 3. If connected, set resolution and FPS (the pipeline caps fix these for GStreamer)
+            camera.set(cv2.CAP_PROP_FRAME_WIDTH, self.config.camera_width)
+            camera.set(cv2.CAP_PROP_FRAME_HEIGHT, self.config.camera_height)
+            camera.set(cv2.CAP_PROP_FPS, self.config.camera_fps)
+
+        # 4. Keep a single buffered frame: a read after a slow inference returns
+        #    the newest frame instead of one queued up while the model was busy
+        camera.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        self.camera = camera
+
+    def _gstreamer_pipeline(self) -> str:
+        # Frames stay at the camera's aspect ratio; _prepare_input letterboxes them
+        config = self.config
+        return (
+            f"libcamerasrc ! video/x-raw,format=NV12,width={config.camera_width},"
+            f"height={config.camera_height},framerate={config.camera_fps}/1 ! "
+            "videoconvert ! video/x-raw,format=BGR ! "
+            "appsink drop=true max-buffers=1 sync=false"
+        )
+
+    def _capture_worker(self):
+        # Loop while capturing:
+        #   1. Read frame from camera (blocks on the device, not on inference)
+        #   2. Overwrite the slot; older unconsumed frames are simply dropped
+        camera = self.camera
+        while self._capturing:
+            ret, frame = camera.read()
+            if not ret:
+                time.sleep(0.05)
+                continue
+            with self._frame_cond:
+                self._latest_frame = frame
+                self._frame_seq += 1
+                self._frame_cond.notify_all()
+
+    def capture_frame(self, timeout: float = 1.0) -> Optional[np.ndarray]:
+        # 1. Wait for a frame newer than the last one handed out
+        # 2. Return frame if one arrived in time, else None
+        #    (read() allocates a new array per frame, so no copy is needed)
+        with self._frame_cond:
+            fresh = self._frame_cond.wait_for(
+                lambda: self._frame_seq != self._read_seq, timeout=timeout
+            )
+            if not fresh:
+                return None
+            self._frames_dropped += self._frame_seq - self._read_seq - 1
+            self._read_seq = self._frame_seq
+            return self._latest_frame
+
+    def _configure_input(self, height: int, width: int):
+        """
+        Allocates the letterbox buffers for frames of the given size once,
+        so detect_potholes only resizes and normalizes into them.
+        """
+        imgsz = self.config.imgsz
+        scale = min(imgsz / width, imgsz / height)
+        new_w, new_h = round(width * scale), round(height * scale)
+        left, top = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+
+        self._in_src_shape = (height, width)
+        self._in_box = (top, left, new_h, new_w)
+        self._in_offset = np.array([left, top, left, top], np.float32)
+        self._in_scale = scale
+
+        if self.device == 'cuda':
+            # Raw uint8 frames go up through a page-locked staging tensor (a quarter
+            # of the float32 bytes) and are letterboxed on the GPU, into a
+            # persistent device input whose padding is filled once
+            self._in_frames = torch.empty(
+                (self.batch_size, height, width, 3), dtype=torch.uint8, pin_memory=True
+            )
+            self._in_frames_np = self._in_frames.numpy()  # shares memory with _in_frames
+            self._d_frames = torch.empty_like(self._in_frames, device=self.device)
+            self._d_input = torch.full(
+                (self.batch_size, 3, imgsz, imgsz), 114 / 255,  # Ultralytics pad value
+                dtype=torch.float16 if self._half else torch.float32, device=self.device,
+            )
+            return
+
+        # On CPU, letterbox with OpenCV into a reused HWC buffer and normalize into
+        # a NumPy view of the input tensor
+        self._in_resized = np.empty((new_h, new_w, 3), np.uint8)
+        self._in_hwc = np.full((imgsz, imgsz, 3), 114, np.uint8)
+        self._in_view = self._in_hwc[top:top + new_h, left:left + new_w]
+        self._in_tensor = torch.empty((self.batch_size, 3, imgsz, imgsz), dtype=torch.float32)
+        self._in_nchw = self._in_tensor.numpy()  # shares memory with _in_tensor
+
+    def _prepare_input(self, frames: List[np.ndarray]) -> torch.Tensor:
+        # 1. Reallocate only if the camera delivered a different frame size
+        #    (frames of one batch come from the same camera)
+        if frames[0].shape[:2] != self._in_src_shape:
+            self._configure_input(*frames[0].shape[:2])
+        if self.device == 'cuda':
+            return self._prepare_input_cuda(frames)
+
+        for slot, frame in enumerate(frames):
+            # 2. Resize into the letterbox interior; the padding is never touched
+            cv2.resize(frame, self._in_resized.shape[1::-1], dst=self._in_resized)
+            self._in_view[...] = self._in_resized
+
+            # 3. BGR HWC uint8 -> RGB CHW float 0-1, in place in this frame's slot
+            np.divide(self._in_hwc[:, :, ::-1].transpose(2, 0, 1),
+                      255.0, out=self._in_nchw[slot])
+        return self._in_tensor
+
+    def _prepare_input_cuda(self, frames: List[np.ndarray]) -> torch.Tensor:
+        n = len(frames)
+
+        # 1. Stage the raw frames and upload them in one async copy
+        for slot, frame in enumerate(frames):
+            self._in_frames_np[slot] = frame
+        d_frames = self._d_frames[:n]
+        d_frames.copy_(self._in_frames[:n], non_blocking=True)
+
+        # 2. BGR -> RGB, HWC -> CHW, resize and scale to 0-1 on the device,
+        #    written straight into the letterbox interior of the input
+        top, left, new_h, new_w = self._in_box
+        rgb = d_frames.flip(-1).permute(0, 3, 1, 2).to(self._d_input.dtype)
+        if rgb.shape[2:] != (new_h, new_w):
+            rgb = F.interpolate(rgb, size=(new_h, new_w), mode='bilinear', align_corners=False)
+        self._d_input[:n, :, top:top + new_h, left:left + new_w].copy_(rgb.mul_(1 / 255))
+        return self._d_input
+
+    def capture_batch(self, n: int, timeout: float = 1.0) -> List[np.ndarray]:
+        """
+        Collects up to `n` consecutive fresh frames; returns early with what
+        it has if the camera stalls for `timeout`.
+        """
+        frames = []
+        while len(frames) < n:
+            frame = self.capture_frame(timeout)
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    def get_frame_counts(self) -> Tuple[int, int]:
+        # (frames captured, frames dropped unread)
+        with self._frame_cond:
+            return self._frame_seq, self._frames_dropped
+
+    def detect_potholes(self, frame: np.ndarray) -> Tuple[Detections, float]:
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames: List[np.ndarray]) -> List[Tuple[Detections, float]]:
+        """
+        Runs one forward pass over up to batch_size frames; returns a
+        (detections, max confidence) pair per frame, in order.
+        """
+        with self._infer_lock:
+            # 1. Fall back to the tiny model once the sensor-triggered hold expires
+            if self.active == 'full' and 'tiny' in self.models and time.monotonic() > self._full_until:
+                self._activate('tiny')
+
+            # 2. Run the backend directly on the preallocated input batch, skipping
+            #    Ultralytics' predictor (its per-frame letterbox/normalize/H2D copies),
+            #    then NMS with the configured thresholds
+            #    The input holds batch_size slots with the first n filled; backends
+            #    with a fixed batch dimension run all slots and the extra
+            #    outputs are dropped
+            backend = self.model.predictor.model
+            frames = frames[:self.batch_size]
+            inputs = self._prepare_input(frames)
+            if backend.pt or getattr(backend, 'dynamic', False):
+                inputs = inputs[:len(frames)]
+            if backend.fp16 != (inputs.dtype == torch.float16):
+                inputs = inputs.half() if backend.fp16 else inputs.float()
+            nms = self._nms_settings
+            with torch.inference_mode():
+                results = non_max_suppression(
+                    backend(inputs),
+                    nms['conf'],
+                    nms['iou'],
+                    classes=self._nms_classes,
+                    max_det=nms['max_det'],
+                )[:len(frames)]
+            names = self.model.names
+            offset, scale = self._in_offset, self._in_scale
+
+        # 3. Pull every frame's rows in one device-to-host transfer as a contiguous
+        #    (N, 6) float32 array (none at all when nothing survived NMS), then map
+        #    boxes from letterbox back to frame coordinates
+        counts = [len(result) for result in results]
+        if sum(counts):
+            stacked = torch.cat([result for result in results if len(result)])
+            raw_all = np.ascontiguousarray(stacked.cpu().numpy(), dtype=np.float32)
+            raw_all[:, :4] -= offset
+            raw_all[:, :4] /= scale
+        else:
+            raw_all = np.empty((0, 6), np.float32)
+
+        outputs = []
+        for raw in np.split(raw_all, np.cumsum(counts)[:-1]):
+            # 4. Filter by confidence, split into boxes/scores/classes and take the
+            #    max confidence in one compiled pass
+            boxes, scores, classes, max_conf = _decode_njit(raw, self.confidence_threshold)
+
+            # 5. Keep the arrays; dicts are only built at the upload boundary
+            outputs.append((Detections(boxes, scores, classes, names), float(max_conf)))
+        return outputs
+
+    def save_detection_image(self, image_path: str, detections: Detections,
+                             frame: Optional[np.ndarray] = None):
         # 1. Capture current frame (or use passed frame)
-        # 2. Annotate frame with bounding boxes
-        # 3. Write image to disk at image_path
-        pass
-    
-    def _draw_detections(self, frame: np.ndarray, detections: List[Dict]) -> np.ndarray:
+        if frame is None:
+            frame = self.capture_frame()
+            if frame is None:
+                raise RuntimeError("No frame available for detection image")
+
+        # 2. Annotate frame with bounding boxes (draws on the frame itself)
+        annotated = self._draw_detections_inplace(frame, detections)
+
+        # 3. Write image to disk at image_path; quality 80 is visually the same
+        #    on road frames at roughly a third of the size and encode cost of 95
+        if not cv2.imwrite(image_path, annotated, JPEG_PARAMS):
+            raise IOError(f"Failed to write {image_path}")
+
+    def _draw_detections_inplace(self, frame: np.ndarray, detections: Detections) -> np.ndarray:
+        """
+        Draws boxes and labels directly onto `frame` and returns it; callers
+        must not need the unannotated pixels afterwards. Only a read-only
+        frame is copied first.
+        """
+        annotated_frame = frame if frame.flags.writeable else np.array(frame)
+        height, width = annotated_frame.shape[:2]
+        t = BOX_THICKNESS
+        boxes = np.clip(
+            detections.boxes, 0, [width - 1, height - 1, width - 1, height - 1]
+        ).astype(np.int32)
+
         # 1. Loop through detections
-        # 2. Draw rectangle for bbox
-        # 3. Draw label text with confidence
+        for (x1, y1, x2, y2), score, class_id in zip(
+            boxes.tolist(), detections.scores.tolist(), detections.classes.tolist()
+        ):
+            # 2. Draw rectangle for bbox as four slice fills (no per-call marshalling)
+            annotated_frame[y1:y1 + t, x1:x2 + 1] = BOX_COLOR
+            annotated_frame[max(y2 - t + 1, 0):y2 + 1, x1:x2 + 1] = BOX_COLOR
+            annotated_frame[y1:y2 + 1, x1:x1 + t] = BOX_COLOR
+            annotated_frame[y1:y2 + 1, max(x2 - t + 1, 0):x2 + 1] = BOX_COLOR
+
+            # 3. Draw label text with confidence
+            label = f"{detections.names.get(class_id, class_id)} {score:.2f}"
+            cv2.putText(annotated_frame, label, (x1, max(y1 - 5, 10)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, BOX_COLOR, 1)
+
         # 4. Return annotated frame
-        return frame
-    
+        return annotated_frame
+
     def get_status(self) -> Dict:
         # Return detector status (loaded, camera status, thresholds)
         return {}
\ No newline at end of file
@@ -4,12 +4,32 @@ import time
 import threading
 import logging
 from typing import Dict, List, Optional
-from dataclasses import dataclass
+from dataclasses import asdict, dataclass
+
+import numpy as np
+import pigpio
+import pynmea2
 
 # Abstract Hardware Libraries
-# import RPi.GPIO as GPIO
 # import serial
 
+logger = logging.getLogger(__name__)
+
+# cm per microsecond of echo: speed of sound (343 m/s) / 2 for the round trip
+ECHO_CM_PER_US = 0.01715
+# Longest echo worth waiting for (~5 m range)
+ECHO_TIMEOUT = 0.03
+
+# History sensor_type <-> uint8 kind id
+SENSOR_KINDS = ('ultrasonic', 'vibration')
+_KIND_IDS = {name: kind for kind, name in enumerate(SENSOR_KINDS)}
+# Vibration and depth dip closer than this (s) are the same impact
+CORRELATION_WINDOW = 0.2
+# Ultrasonic sampling period (s); one echo wait fits well inside it
+SAMPLE_INTERVAL = 0.1
+# Pause before retrying the GPS port when it had no sentence (module reports ~1 Hz)
+GPS_RETRY_INTERVAL = 1.0
+
 @dataclass
 class SensorReading:
     """Standardized sensor data packet."""
@@ -38,8 +58,25 @@ class SensorManager:
         Configure sensor pins and sampling parameters.
         """
         self.config = config
-        self.readings_history = []
+        # Reading history as a ring of parallel arrays (timestamp, value, kind);
+        # _history_count only grows, the write slot is count % size
+        self.max_history_size = 1000
+        self._history_ts = np.empty(self.max_history_size, np.float64)
+        self._history_val = np.empty(self.max_history_size, np.float32)
+        self._history_kind = np.empty(self.max_history_size, np.uint8)
+        self._history_count = 0
+        self._history_lock = threading.Lock()
         self.current_readings = {}
+        # get_current_readings' dict form, rebuilt only after readings change
+        self._readings_version = 0
+        self._cached_readings = None  # (version, readings dict)
+
+        # Set from the vibration ISR / sampling thread when a pothole
+        # signature may be present; consumers block on it instead of polling.
+        # Edge-triggered: only evidence newer than the last signal counts.
+        self.indicator_event = threading.Event()
+        self._signal_lock = threading.Lock()
+        self._signalled_at = float('-inf')
         
         self._initialize_hardware()
 
@@ -47,60 +84,173 @@ class SensorManager:
         """
         Setup GPIO mode, pin inputs/outputs/events, and Serial connections.
         """
-        # GPIO.setmode(...)
-        # GPIO.setup(...)
-        # GPIO.add_event_detect(...)
-        ...
+        # 1. pigpio timestamps echo edges in the daemon (microsecond ticks),
+        #    so no Python loop has to poll the echo pin
+        self._pi = pigpio.pi()
+        self._echo_cb = self._vib_cb = None
+        if not self._pi.connected:
+            # Keep running on camera detections alone (GPS is separate)
+            logger.warning("pigpio daemon not running (sudo pigpiod); "
+                           "ultrasonic and vibration sensors disabled")
+            self._pi = None
+            return
+        self._trig_pin = self.config.sensor_pins['trig']
+        echo_pin = self.config.sensor_pins['echo']
+        self._pi.set_mode(self._trig_pin, pigpio.OUTPUT)
+        self._pi.write(self._trig_pin, 0)
+        self._pi.set_mode(echo_pin, pigpio.INPUT)
+
+        self._echo_rise_tick = None
+        self._echo_width_us = None
+        self._echo_done = threading.Event()
+        self._echo_cb = self._pi.callback(echo_pin, pigpio.EITHER_EDGE, self._echo_callback)
+
+        # 2. Vibration sensor: the daemon reports rising edges, no polling
+        vib_pin = self.config.sensor_pins['vibration']
+        self._pi.set_mode(vib_pin, pigpio.INPUT)
+        self._vib_cb = self._pi.callback(
+            vib_pin, pigpio.RISING_EDGE,
+            lambda gpio, level, tick: self._vibration_callback(gpio),
+        )
 
     def initialize(self):
         """
-        Start the background data acquisition thread.
+        Start the background data acquisition threads.
+        GPS gets its own thread so a blocking serial read never delays
+        ultrasonic sampling.
         """
         self.monitoring = True
-        # threading.Thread(target=self._monitoring_loop).start()
-        ...
+        threading.Thread(target=self._monitoring_loop, daemon=True).start()
+        threading.Thread(target=self._gps_loop, daemon=True).start()
 
     def cleanup(self):
         """
         Safe signal shutdown and GPIO cleanup.
         """
         self.monitoring = False
-        # GPIO.cleanup()
-        ...
+        if self._pi is None:
+            return
+        self._echo_cb.cancel()
+        self._vib_cb.cancel()
+        self._pi.stop()
 
     def _monitoring_loop(self):
         """
         Continuous sensing loop running in a background thread.
-        Polls non-interrupt sensors (Ultrasonic, GPS).
+        Polls the non-interrupt distance sensor (GPS runs in _gps_loop).
         """
         while self.monitoring:
             # 1. Get distance
             dist = self._read_ultrasonic()
             
-            # 2. Get location
-            gps = self._read_gps()
-            
-            # 3. Update State
-            self._update_readings(dist, gps)
+            # 2. Update State
+            self._update_readings(dist, None)
+
+            # 3. Wake consumers only when there is something new to look at
+            self._signal_indicators()
             
-            time.sleep(0.1)
+            time.sleep(SAMPLE_INTERVAL)
+
+    def _gps_loop(self):
+        """
+        Blocks on the GPS serial port; the module paces itself (~1 Hz).
+        """
+        while self.monitoring:
+            gps = self._read_gps()
+            if gps is None:
+                time.sleep(GPS_RETRY_INTERVAL)
+                continue
+            self._update_readings(None, gps)
+
+    def _update_readings(self, dist: Optional[SensorReading], gps: Optional[GPSLocation]):
+        """
+        Publishes fresh readings. None means the sensor was not re-read this
+        tick (or had no data), so its cached value stays current.
+        """
+        if dist is not None:
+            self.current_readings['ultrasonic'] = dist
+            self._store_reading(dist)
+        if gps is not None:
+            self.current_readings['gps'] = gps
+        if dist is not None or gps is not None:
+            self._readings_version += 1
+
+    def _store_reading(self, reading: SensorReading):
+        with self._history_lock:
+            slot = self._history_count % self.max_history_size
+            self._history_ts[slot] = reading.timestamp
+            self._history_val[slot] = reading.value
+            self._history_kind[slot] = _KIND_IDS[reading.sensor_type]
+            self._history_count += 1
+
+    def get_recent_readings(self, seconds: float) -> List[Dict]:
+        """
+        Readings from the last `seconds`, oldest first. Each chronological
+        run of the ring is binary-searched for the cutoff, and dicts are
+        built only for the rows returned.
+        """
+        cutoff = time.time() - seconds
+        size = self.max_history_size
+        with self._history_lock:
+            count = self._history_count
+            head = count % size
+            runs = [(head, size), (0, head)] if count > size else [(0, count)]
+            rows = [
+                np.arange(start + np.searchsorted(self._history_ts[start:end], cutoff), end)
+                for start, end in runs
+            ]
+            rows = np.concatenate(rows)
+            ts = self._history_ts[rows]
+            val = self._history_val[rows]
+            kind = self._history_kind[rows]
+
+        return [
+            {'timestamp': t, 'value': v, 'sensor_type': SENSOR_KINDS[k]}
+            for t, v, k in zip(ts.tolist(), val.tolist(), kind.tolist())
+        ]
 
     def _vibration_callback(self, channel):
         """
         Hardware interrupt handler for vibration sensor.
         """
         # Detected rising/falling edge
-        # Log event and store reading
-        ...
+        # Log event (formatted only if DEBUG is on) and store reading
+        reading = SensorReading(time.time(), 1.0, "vibration")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Vibration on channel %d at %.3f", channel, reading.timestamp)
+        self._store_reading(reading)
+        self._signal_indicators()
+
+    def _echo_callback(self, gpio: int, level: int, tick: int):
+        """
+        pigpio edge callback: the echo pulse width is the tick delta
+        between its rising and falling edge.
+        """
+        if level == 1:
+            self._echo_rise_tick = tick
+        elif level == 0 and self._echo_rise_tick is not None:
+            self._echo_width_us = pigpio.tickDiff(self._echo_rise_tick, tick)
+            self._echo_rise_tick = None
+            self._echo_done.set()
 
     def _read_ultrasonic(self) -> Optional[SensorReading]:
         """
         Perform ultrasonic distance measurement (Trig/Echo logic).
+        None if the measurement timed out or pigpio is unavailable.
         """
-        # Send Pulse
-        # Measure Pulse Width
-        # Calculate Distance = (Time * SpeedOfSound) / 2
-        return SensorReading(time.time(), 0.0, "ultrasonic")
+        if self._pi is None:
+            return None
+
+        # 1. Send a 10 us trigger pulse (timed by the daemon)
+        self._echo_done.clear()
+        self._pi.gpio_trigger(self._trig_pin, 10, 1)
+
+        # 2. Block until the callback has measured the pulse width
+        if not self._echo_done.wait(ECHO_TIMEOUT):
+            return None
+
+        # 3. Calculate Distance = (Time * SpeedOfSound) / 2
+        return SensorReading(time.time(), self._echo_width_us * ECHO_CM_PER_US, "ultrasonic")
 
     def _read_gps(self) -> Optional[GPSLocation]:
         """
@@ -111,16 +261,89 @@ class SensorManager:
         #    return self._parse_gpgga(line)
         return None
 
+    def _parse_gpgga(self, line: str) -> Optional[GPSLocation]:
+        """
+        Decode a $GPGGA sentence; None if it is malformed or has no fix.
+        """
+        try:
+            msg = pynmea2.parse(line)
+        except pynmea2.ParseError:
+            return None
+        if not msg.gps_qual:
+            return None
+        return GPSLocation(
+            msg.latitude,
+            msg.longitude,
+            float(msg.altitude or 0.0),
+            0.0,  # GGA carries no speed
+            time.time(),
+            int(msg.gps_qual),
+        )
+
     def get_current_readings(self) -> Dict:
         """
         Returns the most recent valid readings from all sensors.
+        Served from the values cached by the monitoring loop; never touches
+        the sensor buses. The returned dict is shared between callers until
+        the next update, so treat it as read-only.
         """
-        return self.current_readings
+        version = self._readings_version
+        cached = self._cached_readings
+        if cached is None or cached[0] != version:
+            cached = (version, {
+                name: asdict(reading) for name, reading in list(self.current_readings.items())
+            })
+            self._cached_readings = cached
+        return cached[1]
         
-    def check_pothole_indicators(self) -> Dict[str, bool]:
+    def _signal_indicators(self):
+        """
+        Sets indicator_event once per new piece of evidence. Not gated on the
+        detection cooldown: that runs from the last recorded detection, and
+        a signal whose inference found nothing must not mask the next bump.
+        """
+        with self._signal_lock:
+            checked_at = time.time()
+            indicators = self.check_pothole_indicators(since=self._signalled_at)
+            if indicators['vibration'] or indicators['ultrasonic']:
+                self._signalled_at = checked_at
+                self.indicator_event.set()
+
+    def check_pothole_indicators(self, since: float = float('-inf')) -> Dict[str, bool]:
         """
         Analyzes recent readings to determine if physical signatures
         (sudden vibration + depth change) match a pothole profile.
+        Only vibrations and dips timestamped after `since` count as evidence;
+        the whole window still sets the depth baseline.
         """
-        # Logic to correlate vibration timestamp with ultrasonic depth anomaly
-        return {'vibration': False, 'ultrasonic': False}
\ No newline at end of file
+        # 1. Select the window's vibration events and distance samples
+        #    (boolean masks over the whole ring; slot order does not matter)
+        now = time.time()
+        with self._history_lock:
+            filled = min(self._history_count, self.max_history_size)
+            ts = self._history_ts[:filled]
+            kind = self._history_kind[:filled]
+            recent = ts >= now - self.config.indicator_window
+            vib_ts = ts[recent & (kind == _KIND_IDS['vibration'])]
+            us = recent & (kind == _KIND_IDS['ultrasonic'])
+            us_ts = ts[us]
+            us_val = self._history_val[:filled][us]
+
+        # 2. Depth anomaly: distance jumps above the window's median road distance
+        if us_val.size >= 3:
+            dips = us_val - np.median(us_val) > self.config.pothole_depth_cm
+        else:
+            dips = np.zeros(us_val.size, bool)
+
+        # 3. Correlate vibration timestamps with depth anomalies
+        vib_ts = vib_ts[vib_ts > since]
+        dip_ts = us_ts[dips]
+        dip_ts = dip_ts[dip_ts > since]
+        correlated = bool(vib_ts.size and dip_ts.size) and bool(
+            (np.abs(vib_ts[:, None] - dip_ts[None, :]) < CORRELATION_WINDOW).any()
+        )
+        return {
+            'vibration': bool(vib_ts.size),
+            'ultrasonic': bool(dip_ts.size),
+            'correlated': correlated,
+        }
\ No newline at end of file
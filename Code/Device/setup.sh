@@ -46,7 +46,9 @@ sudo apt install -y \
     vim \
     htop \
     i2c-tools \
-    libi2c-dev
+    libi2c-dev \
+    libasound2-dev \
+    pigpio
 
 # Enable required interfaces
 echo "Enabling required interfaces..."
@@ -75,6 +77,11 @@ if ! grep -q "dtparam=spi=on" /boot/config.txt; then
     echo "dtparam=spi=on" | sudo tee -a /boot/config.txt
 fi
 
+# Start the pigpio daemon now and at boot (ultrasonic echo timing and the
+# vibration interrupt go through it; without it both sensors are disabled)
+echo "Enabling pigpio daemon..."
+sudo systemctl enable --now pigpiod
+
 # Add user to required groups
 echo "Adding user to required groups..."
 sudo usermod -a -G gpio,i2c,spi $USER
@@ -283,6 +290,7 @@ echo
 echo "For troubleshooting, check:"
 echo "- Camera: libcamera-hello --list-cameras"
 echo "- GPIO: python3 -c 'import RPi.GPIO as GPIO; print(\"GPIO OK\")'"
+echo "- Sensors: systemctl status pigpiod"
 echo "- System: ./system_info.py"
 echo
 echo "Setup completed successfully!"
@@ -1,40 +1,123 @@
 #!/usr/bin/env python3
 
+import os
+import socket
 import sys
-import json
+import time
+import orjson
 import requests
-from datetime import datetime
+from datetime import datetime, timezone
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+
+def _create_session():
+    # One keep-alive connection pool shared by every step of the test
+    session = requests.Session()
+    session.headers['Content-Type'] = 'application/json'
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=4)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
 
 def test_backend_connection():
     
     # 1. Define backend connection details (Source: Hardcoded or Env)
+    base_url = os.environ.get('BACKEND_URL', "http://192.168.0.3:8080")
+    username = os.environ.get('BACKEND_USERNAME', "device")
+    password = os.environ.get('BACKEND_PASSWORD', "")
+    session = _create_session()
     
     print("=== Backend Connection Test ===")
     
     # 2. Test Step 1: Authentication (Login)
     #    - Send POST /api/auth/login
     #    - If successful, save tokens
+    try:
+        response = session.post(
+            f"{base_url}/api/auth/login",
+            data=orjson.dumps({'username': username, 'password': password}),
+            timeout=10,
+        )
+    except requests.RequestException as e:
+        print(f"✗ Login failed: {e}")
+        return False
+    if response.status_code != 200:
+        print(f"✗ Login failed: HTTP {response.status_code}")
+        return False
+    tokens = orjson.loads(response.content)
+    print("✓ Login successful")
+
+    # expires_at is read back by later runs (see BackendClient), so it stays
+    # wall-clock: a monotonic reading means nothing to another process
+    token_storage = {
+        'access_token': tokens.get('accessToken'),
+        'refresh_token': tokens.get('refreshToken'),
+        'expires_at': time.time() + tokens.get('expiresIn', 900),
+    }
+    with open('tokens.json', 'wb') as f:
+        f.write(orjson.dumps(token_storage, option=orjson.OPT_INDENT_2))
+    session.headers['Authorization'] = f"Bearer {token_storage['access_token']}"
     
     # 3. Test Step 2: Health Check (Authenticated)
     #    - Send GET /api/health with Bearer token
+    response = session.get(f"{base_url}/api/health", timeout=10)
+    health_ok = response.status_code == 200
+    print(f"{'✓' if health_ok else '✗'} Health check: HTTP {response.status_code}")
     
     # 4. Test Step 3: Detection Upload
     #    - Create valid dummy detection object
     #    - Send POST /api/detections
+    detection = {
+        # Serialized by orjson straight from the datetime ("...Z")
+        'timestamp': datetime.now(timezone.utc),
+        'trigger_source': 'test',
+        'confidence': 0.87,
+        'detections': [
+            {'bbox': [120.0, 200.0, 260.0, 310.0], 'confidence': 0.87,
+             'class_id': 0, 'class_name': 'pothole'},
+        ],
+        'location': {'latitude': 23.8103, 'longitude': 90.4125},
+    }
+    response = session.post(
+        f"{base_url}/api/detections",
+        data=orjson.dumps(detection, option=orjson.OPT_UTC_Z),
+        timeout=10,
+    )
+    upload_ok = response.status_code in (200, 201)
+    print(f"{'✓' if upload_ok else '✗'} Detection upload: HTTP {response.status_code}")
     
     # 5. Test Step 4: Token Refresh
     #    - Send POST /api/auth/refresh
+    response = session.post(
+        f"{base_url}/api/auth/refresh",
+        data=orjson.dumps({'refreshToken': token_storage['refresh_token']}),
+        timeout=10,
+    )
+    refresh_ok = response.status_code == 200
+    print(f"{'✓' if refresh_ok else '✗'} Token refresh: HTTP {response.status_code}")
     
     # 6. Return overall success status
-    return True
+    session.close()
+    return health_ok and upload_ok and refresh_ok
 
 def test_network_connectivity():
-    # 1. Ping the backend server IP
+    # 1. Open a TCP connection to the backend's service port
+    #    (what the uploader needs, unlike an ICMP ping)
+    url = urlparse(os.environ.get('BACKEND_URL', "http://192.168.0.3:8080"))
+    address = (url.hostname, url.port or (443 if url.scheme == 'https' else 80))
+
     # 2. Print result
-    pass
+    try:
+        socket.create_connection(address, timeout=1).close()
+    except OSError as e:
+        print(f"✗ {address[0]}:{address[1]} unreachable: {e}")
+        return False
+    print(f"✓ TCP reachable: {address[0]}:{address[1]}")
+    return True
 
 if __name__ == "__main__":
     # 1. Run network test
     # 2. Run backend application test
     # 3. Exit with appropriate status code
-    pass
\ No newline at end of file
+    ok = test_network_connectivity() and test_backend_connection()
+    sys.exit(0 if ok else 1)
\ No newline at end of file